@@ -1,178 +1,349 @@
 #!/usr/bin/env python3
-import re
+import io
+import multiprocessing
+import os
 import sys
-from collections import defaultdict
+from array import array
+from collections import deque
 
-def analyze_torfs_output(input_file):
+# Epoch and relay statistics lines, by the kind of event they produce. The
+# numbers follow fixed literals, so they are cut out with str.partition.
+STATS_MARKERS = [
+    ('epoch', 'Entering simulation epoch with consensus from'),
+    ('relay_stats', 'Total relays in consensus: '),
+    ('adv_stats', 'Total adversary guard relays: ')
+]
+
+# Circuit lines make up the bulk of a trace and have a fixed layout
+# ("[<time>] Client <id> uses the following circuit ...: <guard> <middle> <exit>"),
+# so they are split with plain string operations as well.
+CIRCUIT_MARKER = 'uses the following circuit for a stream request: '
+CIRCUIT_MARKER_LEN = len(CIRCUIT_MARKER)
+
+# Traces can be several GB, read them in 1 MiB blocks instead of the 8 KiB default
+READ_BUFFER_SIZE = 1 << 20
+
+# Largest byte range handed to one worker when parsing in parallel
+CHUNK_SIZE = 64 << 20
+
+# Description of each 3-bit compromise code (guard | middle << 1 | exit << 2)
+COMPROMISE_DESCRIPTIONS = [
+    "none",
+    "guard",
+    "middle",
+    "guard+middle",
+    "exit",
+    "guard+exit",
+    "middle+exit",
+    "guard+middle+exit"
+]
+
+# All possible compromise combinations, in report order
+ALL_COMBINATIONS = [
+    0b001,  # guard
+    0b010,  # middle
+    0b100,  # exit
+    0b011,  # guard+middle
+    0b101,  # guard+exit
+    0b110,  # middle+exit
+    0b111   # all three
+]
+
+def leading_digits(text):
+    """Return the run of decimal digits at the start of text"""
+    end = 0
+    while end < len(text) and text[end].isdecimal():
+        end += 1
+    return text[:end]
+
+def scan_trace(input_file, start, end, seen_circuits):
+    """Yield the parsed events of all lines starting within [start, end) of the trace
+
+    Every new circuit ID is added to seen_circuits. The first occurrence of
+    a compromised circuit is yielded as ('circuit', circuit_id, client_id,
+    comp_type). Statistics lines are yielded as ('epoch', line),
+    ('relay_stats', total, guards, exits) and ('adv_stats', guards, exits).
+    """
+    # Hot loop: keep everything it touches in locals
+    marker, marker_len = CIRCUIT_MARKER, CIRCUIT_MARKER_LEN
+    seen_add = seen_circuits.add
+
+    with open(input_file, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        if start > 0:
+            # The line crossing `start` belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+
+        while pos < end:
+            # Work on newline-aligned blocks so no line is split between two reads
+            data = f.read(min(READ_BUFFER_SIZE, end - pos))
+            if not data:
+                break
+            if not data.endswith(b'\n'):
+                data += f.readline()
+            pos += len(data)
+            block = data.decode()
+
+            # Process circuit information, jumping from marker to marker
+            # without visiting the lines in between
+            idx = block.find(marker)
+            while idx >= 0:
+                marker_pos = idx
+                line_end = block.find('\n', marker_pos)
+                if line_end < 0:
+                    line_end = len(block)
+                idx = block.find(marker, line_end)
+
+                # Skip lines not of the form "Client <id> uses ...: <guard> <middle> <exit>",
+                # extra trailing tokens are ignored
+                client_pos = block.rfind('Client ', block.rfind('\n', 0, marker_pos) + 1, marker_pos)
+                client_id = block[client_pos + 7:marker_pos - 1]
+                relays = block[marker_pos + marker_len:line_end].split()
+                if (client_pos < 0 or block[marker_pos - 1] != ' '
+                        or not client_id.isdecimal() or len(relays) < 3):
+                    continue
+                guard, middle, exit_relay = relays[:3]
+
+                # Create unique circuit ID (not really unique but very unlikely to collide).
+                # Only its 64-bit hash is kept, not the relay strings.
+                # hash() of str is salted per process (PYTHONHASHSEED), so which
+                # circuits collide depends on the seed: results are not
+                # reproducible in principle across runs unless the seed is fixed.
+                circuit_id = hash((guard, middle, exit_relay))
+
+                # Only the first occurrence of a circuit is counted
+                if circuit_id in seen_circuits:
+                    continue
+                seen_add(circuit_id)
+
+                # Check compromised status
+                g_comp = guard[-1] == '*'
+                m_comp = middle[-1] == '*'
+                e_comp = exit_relay[-1] == '*'
+                comp_type = g_comp | m_comp << 1 | e_comp << 2
+                if comp_type:
+                    yield ('circuit', circuit_id, int(client_id), comp_type)
+
+            # Epoch and relay statistics are logged once per epoch. Collect
+            # them from the whole block first to handle them in file order.
+            stats = []
+            for kind, stats_marker in STATS_MARKERS:
+                idx = block.find(stats_marker)
+                while idx >= 0:
+                    line_end = block.find('\n', idx)
+                    if line_end < 0:
+                        line_end = len(block)
+                    stats.append((idx, kind, idx + len(stats_marker), line_end))
+                    idx = block.find(stats_marker, line_end)
+            stats.sort()
+
+            for idx, kind, values_start, line_end in stats:
+                if kind == 'epoch':
+                    yield ('epoch', block[block.rfind('\n', 0, idx) + 1:line_end].strip())
+                    continue
+
+                # Skip truncated or malformed lines, trailing text after the
+                # last number is ignored
+                rest = block[values_start:line_end]
+                if kind == 'relay_stats':
+                    total, sep, rest = rest.partition(', Valid/Running Guards: ')
+                    guards, sep2, exits = rest.partition(', Valid/Running Exits: ')
+                    exits = leading_digits(exits)
+                    if sep and sep2 and total.isdecimal() and guards.isdecimal() and exits:
+                        yield ('relay_stats', int(total), int(guards), int(exits))
+                else:
+                    guards, sep, exits = rest.partition(', Total adversary exit relays: ')
+                    exits = leading_digits(exits)
+                    if sep and guards.isdecimal() and exits:
+                        yield ('adv_stats', int(guards), int(exits))
+
+def parse_chunk(args):
+    """Worker for parallel parsing: parse one byte range of the trace
+
+    Returns the IDs of all circuits in the range and its events, which only
+    hold the compromised circuits that are new within the range.
+    """
+    input_file, start, end = args
+    seen_circuits = set()
+    events = list(scan_trace(input_file, start, end, seen_circuits))
+    return seen_circuits, events
+
+def parse_chunks(input_file, jobs):
+    """Parse the trace in parallel, yield (seen_circuits, events) per range in file order"""
+    size = os.path.getsize(input_file)
+    step = max(1, min(CHUNK_SIZE, -(-size // jobs)))
+    ranges = [(input_file, start, min(start + step, size)) for start in range(0, size, step)]
+
+    # Circuit IDs are hash() values, which are only comparable between
+    # processes sharing the parent's hash salt, so workers must be forked
+    with multiprocessing.get_context('fork').Pool(jobs) as pool:
+        # At most two ranges per worker are in flight, which bounds the
+        # results waiting for the parent
+        pending = deque()
+        for chunk in ranges:
+            pending.append(pool.apply_async(parse_chunk, (chunk,)))
+            if len(pending) > 2 * jobs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def append_epoch(epoch_data, total_relays, total_guards, total_exits, adv_guards, adv_exits):
+    """Append the relay statistics of one epoch to their columns"""
+    epoch_data['total_relays'].append(total_relays)
+    epoch_data['total_guards'].append(total_guards)
+    epoch_data['total_exits'].append(total_exits)
+    epoch_data['adv_guards'].append(adv_guards)
+    epoch_data['adv_exits'].append(adv_exits)
+
+def analyze_torfs_output(input_file, jobs=1):
     # Data structures
-    all_circuits = set()
-    circuits_compromised = defaultdict(int)  # Tracks each unique compromised circuit type
-    client_exposures = defaultdict(set)     # Tracks all compromise types per client
+    seen_circuits = set()                    # IDs of all circuits seen so far
+    # Compromise types are packed into a 3-bit code: guard | middle << 1 | exit << 2
+    circuits_compromised = [0] * 8           # Tracks each unique compromised circuit type
+    client_exposures = bytearray(1 << 16)   # Bitmask of all compromise types, indexed by client ID
+    client_counts = [0] * 8                  # Clients per compromise type
+    total_clients = 0                        # Highest exposed client ID + 1
+    compromised_clients = 0
+    multi_exposure_clients = 0               # Clients with more than one compromise type
     
     # Relay statistics
-    epoch_data = []
-    current_epoch = None
-    relay_stats = {
-        'total_relays': 0,
-        'total_guards': 0,
-        'total_exits': 0,
-        'adv_guards': 0,
-        'adv_exits': 0
+    # One contiguous int64 column per statistic, one entry per epoch
+    epoch_data = {
+        'total_relays': array('q'),
+        'total_guards': array('q'),
+        'total_exits': array('q'),
+        'adv_guards': array('q'),
+        'adv_exits': array('q')
     }
+    current_epoch = None
+    total_relays = total_guards = total_exits = adv_guards = adv_exits = 0
 
-    # Patterns
-    patterns = {
-        'epoch': re.compile(r'\[.*\] Entering simulation epoch with consensus from'),
-        'relay_stats': re.compile(r'Total relays in consensus: (\d+), Valid/Running Guards: (\d+), Valid/Running Exits: (\d+)'),
-        'adv_stats': re.compile(r'Total adversary guard relays: (\d+), Total adversary exit relays: (\d+)'),
-        'circuit': re.compile(r'Client (\d+) uses the following circuit for a stream request: (\S+) (\S+) (\S+)')
-    }
+    if jobs > 1:
+        # Chunks are consumed in file order. A circuit already seen in an
+        # earlier chunk is skipped, so it is attributed to its first occurrence.
+        def merge_chunks():
+            for chunk_circuits, events in parse_chunks(input_file, jobs):
+                for event in events:
+                    if event[0] != 'circuit' or event[1] not in seen_circuits:
+                        yield event
+                seen_circuits.update(chunk_circuits)
+        events = merge_chunks()
+    else:
+        events = scan_trace(input_file, 0, os.path.getsize(input_file), seen_circuits)
 
-    with open(input_file) as f:
-        for line in f:
-            # Handle epoch information
-            if patterns['epoch'].search(line):
-                if current_epoch:
-                    epoch_data.append(relay_stats.copy())
-                current_epoch = line.strip()
-                continue
-                
-            # Handle relay statistics
-            relay_match = patterns['relay_stats'].search(line)
-            if relay_match:
-                relay_stats.update({
-                    'total_relays': int(relay_match.group(1)),
-                    'total_guards': int(relay_match.group(2)),
-                    'total_exits': int(relay_match.group(3))
-                })
-                continue
-                
-            # Handle adversary statistics
-            adv_match = patterns['adv_stats'].search(line)
-            if adv_match:
-                relay_stats.update({
-                    'adv_guards': int(adv_match.group(1)),
-                    'adv_exits': int(adv_match.group(2))
-                })
-                continue
-
-            # Process circuit information
-            circuit_match = patterns['circuit'].search(line)
-            if circuit_match:
-                client_id = int(circuit_match.group(1))
-                guard, middle, exit_relay = circuit_match.groups()[1:]
-                
-                # Check compromised status
-                g_comp = guard.endswith('*')
-                m_comp = middle.endswith('*')
-                e_comp = exit_relay.endswith('*')
-                is_compromised = g_comp or m_comp or e_comp
-
-                # Create unique circuit ID (not really unique but very unlikely to collide)
-                circuit_id = (guard, middle, exit_relay)
-                
-                # Track compromised circuits
-                if is_compromised and circuit_id not in all_circuits:
-                    comp_type = (g_comp, m_comp, e_comp)
-                    circuits_compromised[comp_type] += 1
-                    client_exposures[client_id].add(comp_type)
-
-                all_circuits.add(circuit_id)
+    for event in events:
+        kind = event[0]
+
+        # Track compromised circuits
+        if kind == 'circuit':
+            _, _, client_id, comp_type = event
+            circuits_compromised[comp_type] += 1
+            if client_id >= len(client_exposures):
+                client_exposures.extend(bytes(max(client_id + 1, 2 * len(client_exposures)) - len(client_exposures)))
+            seen = client_exposures[client_id]
+            bit = 1 << comp_type
+            if not seen & bit:
+                client_counts[comp_type] += 1
+                if not seen:
+                    compromised_clients += 1
+                    total_clients = max(total_clients, client_id + 1)
+                elif not seen & (seen - 1):
+                    # Second distinct compromise type for this client
+                    multi_exposure_clients += 1
+                client_exposures[client_id] = seen | bit
+
+        # Handle epoch information
+        elif kind == 'epoch':
+            if current_epoch:
+                append_epoch(epoch_data, total_relays, total_guards, total_exits, adv_guards, adv_exits)
+            current_epoch = event[1]
+
+        # Handle relay statistics
+        elif kind == 'relay_stats':
+            _, total_relays, total_guards, total_exits = event
+
+        # Handle adversary statistics
+        else:
+            _, adv_guards, adv_exits = event
 
     # Add final epoch data
     if current_epoch:
-        epoch_data.append(relay_stats)
-
-    # Calculate client counts per compromise type
-    client_counts = defaultdict(int)
-    for exposures in client_exposures.values():
-        for comp_type in exposures:
-            client_counts[comp_type] += 1
+        append_epoch(epoch_data, total_relays, total_guards, total_exits, adv_guards, adv_exits)
 
     return {
-        'total_circuits': len(all_circuits),
-        'compromised_circuits': sum(circuits_compromised.values()),
-        'circuit_counts': dict(circuits_compromised),
-        'total_clients': max(client_exposures.keys()) + 1 if client_exposures else 0,
-        'compromised_clients': len(client_exposures),
-        'client_counts': dict(client_counts),
-        'client_exposures': client_exposures,
+        'total_circuits': len(seen_circuits),
+        'compromised_circuits': sum(circuits_compromised),
+        'circuit_counts': circuits_compromised,
+        'total_clients': total_clients,
+        'compromised_clients': compromised_clients,
+        'client_counts': client_counts,
+        'multi_exposure_clients': multi_exposure_clients,
         'epoch_data': epoch_data
     }
 
 def generate_report(results, output_file=None):
     """Generate a human-readable report"""
-    output = []
-    
-    # All possible compromise combinations
-    all_combinations = [
-        (True, False, False),  # guard
-        (False, True, False),  # middle
-        (False, False, True),  # exit
-        (True, True, False),   # guard+middle
-        (True, False, True),   # guard+exit
-        (False, True, True),   # middle+exit
-        (True, True, True)     # all three
-    ]
-    
-    def describe_compromise(g, m, e):
-        parts = []
-        if g: parts.append("guard")
-        if m: parts.append("middle")
-        if e: parts.append("exit")
-        return '+'.join(parts) if parts else "none"
+    # Each line after the first is written with its leading separator
+    buf = io.StringIO()
+    w = buf.write
 
     # Circuit statistics
-    output.append("CIRCUIT STATISTICS")
-    output.append("==================")
-    output.append(f"Total unique circuits: {results['total_circuits']}")
-    output.append(f"Compromised circuits: {results['compromised_circuits']} ({results['compromised_circuits']/results['total_circuits']:.2%})")
+    w("CIRCUIT STATISTICS")
+    w("\n==================")
+    w(f"\nTotal unique circuits: {results['total_circuits']}")
+    w(f"\nCompromised circuits: {results['compromised_circuits']} ({results['compromised_circuits']/results['total_circuits']:.2%})")
     
     if results['compromised_circuits'] > 0:
-        output.append("\nCOMPROMISED CIRCUIT BREAKDOWN:")
-        for combo in all_combinations:
-            count = results['circuit_counts'].get(combo, 0)
-            if count > 0:
-                output.append(f" - {describe_compromise(*combo)}: {count} circuits ({count/results['compromised_circuits']:.2%})")
+        w("\n\nCOMPROMISED CIRCUIT BREAKDOWN:")
+        circuit_counts = results['circuit_counts']
+        for combo in ALL_COMBINATIONS:
+            count = circuit_counts[combo]
+            if count:
+                w(f"\n - {COMPROMISE_DESCRIPTIONS[combo]}: {count} circuits ({count/results['compromised_circuits']:.2%})")
 
     # Client statistics
-    output.append("\nCLIENT STATISTICS")
-    output.append("================")
-    output.append(f"Total clients: {results['total_clients']}")
-    output.append(f"Clients using compromised circuits: {results['compromised_clients']} ({results['compromised_clients']/results['total_clients']:.2%})")
+    w("\n\nCLIENT STATISTICS")
+    w("\n================")
+    w(f"\nTotal clients: {results['total_clients']}")
+    w(f"\nClients using compromised circuits: {results['compromised_clients']} ({results['compromised_clients']/results['total_clients']:.2%})")
     
     if results['compromised_clients'] > 0:
-        output.append("\nCOMPROMISE TYPES USED BY CLIENTS:")
-        for combo in all_combinations:
-            count = results['client_counts'].get(combo, 0)
-            if count > 0:
-                output.append(f" - {describe_compromise(*combo)}: {count} clients ({count/results['total_clients']:.2%})")
+        w("\n\nCOMPROMISE TYPES USED BY CLIENTS:")
+        client_counts = results['client_counts']
+        for combo in ALL_COMBINATIONS:
+            count = client_counts[combo]
+            if count:
+                w(f"\n - {COMPROMISE_DESCRIPTIONS[combo]}: {count} clients ({count/results['total_clients']:.2%})")
         
         # Clients with multiple exposure types
-        multi_exposure = sum(1 for exp in results['client_exposures'].values() if len(exp) > 1)
+        multi_exposure = results['multi_exposure_clients']
         if multi_exposure > 0:
-            output.append(f"\nClients with multiple exposure types: {multi_exposure} ({multi_exposure/results['compromised_clients']:.2%})")
+            w(f"\n\nClients with multiple exposure types: {multi_exposure} ({multi_exposure/results['compromised_clients']:.2%})")
 
     # Relay statistics
-    if results['epoch_data']:
-        output.append("\nRELAY STATISTICS")
-        output.append("================")
-        num_epochs = len(results['epoch_data'])
-        avg_total = sum(e['total_relays'] for e in results['epoch_data']) / num_epochs
-        avg_guards = sum(e['total_guards'] for e in results['epoch_data']) / num_epochs
-        avg_exits = sum(e['total_exits'] for e in results['epoch_data']) / num_epochs
-        avg_adv_guards = sum(e['adv_guards'] for e in results['epoch_data']) / num_epochs
-        avg_adv_exits = sum(e['adv_exits'] for e in results['epoch_data']) / num_epochs
+    epoch_data = results['epoch_data']
+    num_epochs = len(epoch_data['total_relays'])
+    if num_epochs:
+        w("\n\nRELAY STATISTICS")
+        w("\n================")
+
+        # sum() runs over each array('q') column in C
+        avg_total = sum(epoch_data['total_relays']) / num_epochs
+        avg_guards = sum(epoch_data['total_guards']) / num_epochs
+        avg_exits = sum(epoch_data['total_exits']) / num_epochs
+        avg_adv_guards = sum(epoch_data['adv_guards']) / num_epochs
+        avg_adv_exits = sum(epoch_data['adv_exits']) / num_epochs
         
-        output.append(f"Number of epochs (started hours): {num_epochs}")
-        output.append("\nAverage across all epochs:")
-        output.append(f" - Total relays: {avg_total:.1f}")
-        output.append(f" - Guard relays: {avg_guards:.1f} ({avg_guards/avg_total:.1%} of total)")
-        output.append(f" - Exit relays: {avg_exits:.1f} ({avg_exits/avg_total:.1%} of total)")
-        output.append(f" - Adversary guards: {avg_adv_guards:.1f} ({avg_adv_guards/avg_guards:.1%} of guards)")
-        output.append(f" - Adversary exits: {avg_adv_exits:.1f} ({avg_adv_exits/avg_exits:.1%} of exits)")
-
-    report = '\n'.join(output)
+        w(f"\nNumber of epochs (started hours): {num_epochs}")
+        w("\n\nAverage across all epochs:")
+        w(f"\n - Total relays: {avg_total:.1f}")
+        w(f"\n - Guard relays: {avg_guards:.1f} ({avg_guards/avg_total:.1%} of total)")
+        w(f"\n - Exit relays: {avg_exits:.1f} ({avg_exits/avg_total:.1%} of total)")
+        w(f"\n - Adversary guards: {avg_adv_guards:.1f} ({avg_adv_guards/avg_guards:.1%} of guards)")
+        w(f"\n - Adversary exits: {avg_adv_exits:.1f} ({avg_adv_exits/avg_exits:.1%} of exits)")
+
+    report = buf.getvalue()
     
     if output_file:
         with open(output_file, 'w') as f:
@@ -180,10 +351,11 @@ def generate_report(results, output_file=None):
     return report
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} <input_trace_file> <output_summary_file>")
+    if len(sys.argv) not in (3, 4):
+        print(f"Usage: {sys.argv[0]} <input_trace_file> <output_summary_file> [jobs]")
         sys.exit(1)
     
-    results = analyze_torfs_output(sys.argv[1])
+    jobs = int(sys.argv[3]) if len(sys.argv) == 4 else 1
+    results = analyze_torfs_output(sys.argv[1], jobs)
     generate_report(results, sys.argv[2])
     print(f"Analysis complete. Report saved to {sys.argv[2]}")